@@ -0,0 +1,29 @@
+"""
+Gunicorn configuration for the Water Kiosk Hardware Server
+Runs the Quart (ASGI) app on uvicorn workers behind nginx:
+
+    gunicorn -c gunicorn.conf.py water_kiosk_hardware_server:app
+"""
+
+import multiprocessing
+import os
+
+# Bind to a unix socket by default so nginx -> app traffic never touches TCP (no TIME_WAIT buildup)
+bind = os.environ.get('KIOSK_BIND', 'unix:/tmp/kiosk.sock')
+
+# Async workers - each one multiplexes many in-flight kiosk requests on its event loop
+workers = int(os.environ.get('KIOSK_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+# UvicornWorker runs on uvloop (libuv) and parses HTTP with httptools when they are installed
+worker_class = 'uvicorn.workers.UvicornWorker'
+
+# Keep client connections open between kiosk requests - longer than nginx's upstream
+# keepalive_timeout (60s) so nginx never reuses a connection the worker just closed
+keepalive = int(os.environ.get('KIOSK_KEEPALIVE', '75'))
+
+# Recycle workers when a request hangs (Appwrite calls time out well before this)
+timeout = 30
+graceful_timeout = 30
+
+accesslog = os.environ.get('KIOSK_ACCESS_LOG')  # e.g. '-' for stdout; disabled by default
+errorlog = '-'
+loglevel = os.environ.get('KIOSK_LOG_LEVEL', 'info')
@@ -1,25 +1,48 @@
 #!/usr/bin/env python3
 """
-Water Kiosk Hardware Server - Python Flask Version
+Water Kiosk Hardware Server - Python Quart (asyncio) Version
 Converted from Node.js WebSocket server to HTTP for better scalability
 Handles kiosk hardware requests for user verification and database operations
 """
 
-import json
+import asyncio
+import atexit
+import collections
+import functools
 import os
+import re
+import hashlib
+import hmac
 import logging
-import random
+import logging.handlers
+import queue
+import time
+import uuid
 from datetime import datetime
-import urllib.request
 import urllib.parse
-import urllib.error
-from flask import Flask, request, jsonify
+import aiohttp
+import msgspec
+import orjson
+import redis.asyncio as redis
+from cachetools import TTLCache
+from quart import Quart, Response, request, jsonify
+from quart.json.provider import DefaultJSONProvider
+from werkzeug.exceptions import HTTPException, RequestEntityTooLarge
 
-# Configure logging
+# Configure logging - handlers only enqueue records; a background thread writes them to stderr
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()  # Use WARNING in production to skip per-request logs
+log_queue = queue.SimpleQueue()
+log_stream_handler = logging.StreamHandler()
+log_stream_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+log_listener = logging.handlers.QueueListener(log_queue, log_stream_handler)
+log_queue_handler = logging.handlers.QueueHandler(log_queue)
+log_queue_handler.setFormatter(logging.Formatter('%(message)s'))  # Final formatting happens in the listener
 logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
+    level=LOG_LEVEL,
+    handlers=[log_queue_handler]
 )
+log_listener.start()
+atexit.register(log_listener.stop)
 logger = logging.getLogger(__name__)
 
 # Configuration Constants - Environment Variables with Fallbacks (UPDATED FOR UNIFIED SCHEMA)
@@ -28,38 +51,270 @@ APPWRITE_DATABASE_ID = os.environ.get('APPWRITE_DATABASE_ID', '6864aed388d20c69a
 APPWRITE_API_KEY = os.environ.get('APPWRITE_API_KEY', '0f3a08c2c4fc98480980cbe59cd2db6b8522734081f42db3480ab2e7a8ffd7c46e8476a62257e429ff11c1d6616e814ae8753fb07e7058d1b669c641012941092ddcd585df802eb2313bfba49bf3ec3f776f529c09a7f5efef2988e4b4821244bbd25b3cd16669885c173ac023b5b8a90e4801f3584eef607506362c6ae01c94')  # Same as SMS
 CUSTOMERS_COLLECTION_ID = os.environ.get('CUSTOMERS_COLLECTION_ID', 'customers')  # Same as SMS
 APPWRITE_ENDPOINT = os.environ.get('APPWRITE_ENDPOINT', 'http://192.168.1.126/v1')
+APPWRITE_POOL_SIZE = int(os.environ.get('APPWRITE_POOL_SIZE', '64'))  # Max open connections to Appwrite per worker
+APPWRITE_KEEPALIVE_TIMEOUT = int(os.environ.get('APPWRITE_KEEPALIVE_TIMEOUT', '30'))  # Seconds to keep idle connections
 
-# Flask app
-app = Flask(__name__)
+# Appwrite request headers never change, so they are sent as session defaults
+APPWRITE_HEADERS = {
+    'X-Appwrite-Project': APPWRITE_PROJECT_ID,
+    'X-Appwrite-Key': APPWRITE_API_KEY,
+    'Content-Type': 'application/json'
+}
+
+# Appwrite URLs and timeouts used on every request are built once at import
+COLLECTIONS_URL = f'{APPWRITE_ENDPOINT}/databases/{APPWRITE_DATABASE_ID}/collections'
+CUSTOMERS_DOCUMENTS_URL = f'{COLLECTIONS_URL}/{CUSTOMERS_COLLECTION_ID}/documents'
+APPWRITE_TIMEOUT = aiohttp.ClientTimeout(total=10)
+LOOKUP_TIMEOUT = aiohttp.ClientTimeout(total=5)
+APPWRITE_MAX_QUERY_VALUES = 100  # Appwrite caps the number of values in one equal() query
+MAX_BATCH_VERIFICATIONS = int(os.environ.get('MAX_BATCH_VERIFICATIONS', '100'))  # Per /dispense-verification/batch call
+BREAKER_FAIL_MAX = int(os.environ.get('BREAKER_FAIL_MAX', '5'))  # Consecutive Appwrite failures before failing fast
+BREAKER_RESET_TIMEOUT = int(os.environ.get('BREAKER_RESET_TIMEOUT', '30'))  # Seconds to fail fast before retrying Appwrite
+TIMESTAMP_REFRESH_INTERVAL = 0.1  # Seconds between refreshes of the cached response timestamp
+MAX_REQUEST_BODY_BYTES = int(os.environ.get('MAX_REQUEST_BODY_BYTES', str(64 * 1024)))  # Kiosk payloads are tiny; a full batch fits easily
+
+# Customer lookup cache - short-lived in-process layer on top of an optional shared Redis layer
+REDIS_URL = os.environ.get('REDIS_URL', '')  # e.g. redis://localhost:6379/0 - leave empty to disable Redis
+CUSTOMER_CACHE_TTL = int(os.environ.get('CUSTOMER_CACHE_TTL', '60'))  # Seconds a lookup stays in Redis
+LOCAL_CACHE_TTL = int(os.environ.get('LOCAL_CACHE_TTL', '5'))  # Seconds a lookup stays in process memory
+CUSTOMER_CACHE_PREFIX = 'kiosk:verify:'
+
+# Phone numbers: optional +, digits only; Kenyan prefix (+254 / 254 / 0) is stripped to build variants
+PHONE_NUMBER_RE = re.compile(r'^\+?[0-9]{7,15}$')
+PHONE_PREFIX_RE = re.compile(r'^(\+?254|0)')
+
+# Background write queue for /database/create and /database/update (use ?sync=true to wait for Appwrite)
+WRITE_QUEUE_SIZE = int(os.environ.get('WRITE_QUEUE_SIZE', '10000'))  # Max pending writes per worker
+WRITE_CONCURRENCY = int(os.environ.get('WRITE_CONCURRENCY', '50'))  # Max queued writes in flight to Appwrite at once
+WRITE_MAX_RETRIES = int(os.environ.get('WRITE_MAX_RETRIES', '5'))  # Retries for a queued write after transient failures
+WRITE_RETRY_DELAY = float(os.environ.get('WRITE_RETRY_DELAY', '2'))  # Seconds before the first retry (doubles each time)
+
+class ORJSONProvider(DefaultJSONProvider):
+    """Quart JSON provider backed by orjson for faster request/response (de)serialization"""
+
+    def dumps(self, obj, **kwargs):
+        option = orjson.OPT_NON_STR_KEYS
+        if kwargs.get('sort_keys', self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+class DispenseResponse(msgspec.Struct, tag_field='type', tag='dispense_response', omit_defaults=True):
+    """Kiosk verification response (same format as Node.js version, but user_id = phone_number)"""
+    # user_id, pin, volume_ml and kiosk_id are echoed back exactly as the kiosk sent them
+    user_id: str | int | None  # Kiosk expects user_id field
+    pin: str | int | None
+    volume_ml: int | float | None
+    approved: bool
+    reason: str
+    timestamp: str
+    kiosk_id: str | int | None
+    user_data: dict | None = None  # Only sent when the customer is approved
+
+class AppwriteError(Exception):
+    """Appwrite answered with a non-2xx status"""
+
+    def __init__(self, status, message):
+        super().__init__(f"HTTP {status}: {message}")
+        self.status = status
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling Appwrite while the circuit breaker is open"""
+
+class CircuitBreaker:
+    """Decorator for Appwrite calls - after fail_max consecutive outages, fail fast for reset_timeout seconds,
+    then let a single trial call through (half-open) and close again only if it succeeds"""
+
+    def __init__(self, name, fail_max, reset_timeout):
+        self.name = name
+        self.fail_max = fail_max
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    @property
+    def is_open(self):
+        """True while open or half-open - i.e. not every call would reach Appwrite"""
+        return self.opened_at is not None
+
+    def before_call(self):
+        """Raise CircuitOpenError unless the call may go ahead - returns True for the half-open trial call"""
+        if self.opened_at is None:
+            return False
+        if time.monotonic() - self.opened_at < self.reset_timeout or self.trial_in_flight:
+            raise CircuitOpenError(f'{self.name} circuit breaker is open')
+        self.trial_in_flight = True
+        return True
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            trial = self.before_call()
+            try:
+                result = await func(*args, **kwargs)
+            except Exception as error:
+                # 4xx responses mean Appwrite is up and rejected the request, so they don't count
+                status = getattr(error, 'status', None)
+                if status and 400 <= status < 500:
+                    self.record_success()
+                else:
+                    self.record_failure()
+                raise
+            finally:
+                if trial:
+                    self.trial_in_flight = False
+            self.record_success()
+            return result
+        return wrapper
+
+    def record_success(self):
+        if self.opened_at is not None:
+            logger.info("✅ %s circuit breaker closed", self.name)
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        # A failed half-open trial leaves failures >= fail_max, so the circuit re-opens for another reset_timeout
+        self.failures += 1
+        if self.failures >= self.fail_max:
+            if self.opened_at is None:
+                logger.warning("⚠️ %s circuit breaker opened after %s failures - failing fast for %ss",
+                               self.name, self.failures, self.reset_timeout)
+            self.opened_at = time.monotonic()
+
+# Separate breakers so failing writes/database calls can't block kiosk verifications (and vice versa)
+customer_lookup_breaker = CircuitBreaker('Customer lookup', BREAKER_FAIL_MAX, BREAKER_RESET_TIMEOUT)
+appwrite_breaker = CircuitBreaker('Appwrite', BREAKER_FAIL_MAX, BREAKER_RESET_TIMEOUT)
+
+# Quart app
+app = Quart(__name__)
+app.json = ORJSONProvider(app)
+app.config['MAX_CONTENT_LENGTH'] = MAX_REQUEST_BODY_BYTES
+
+# Shared, pooled aiohttp session for Appwrite calls (created once the server starts serving)
+http_session = None
+
+# Customer lookup caches (Redis client is only created when REDIS_URL is set)
+customer_cache = TTLCache(maxsize=4096, ttl=LOCAL_CACHE_TTL)
+redis_client = None
+
+# Pending Appwrite writes and the task draining them (created once the server starts serving)
+# Writes to one document are sent in order by a single task; different documents go in parallel
+document_writes = {}  # (collection, document_id) -> deque of pending writes, oldest first
+document_write_tasks = {}  # (collection, document_id) -> task sending that document's writes
+pending_write_count = 0
+write_slots = None  # Semaphore limiting writes in flight to WRITE_CONCURRENCY
+
+# Response timestamp, refreshed every TIMESTAMP_REFRESH_INTERVAL by a background task instead of per request
+current_timestamp = datetime.now().isoformat()
+timestamp_task = None
+
+@app.before_serving
+async def open_http_session():
+    """Create the shared Appwrite HTTP session with a keep-alive connection pool"""
+    global http_session
+    connector = aiohttp.TCPConnector(limit=APPWRITE_POOL_SIZE, keepalive_timeout=APPWRITE_KEEPALIVE_TIMEOUT)
+    http_session = aiohttp.ClientSession(connector=connector, headers=APPWRITE_HEADERS)
+
+@app.before_serving
+async def open_redis_client():
+    """Connect to Redis for the shared customer lookup cache, if configured"""
+    global redis_client
+    if REDIS_URL:
+        redis_client = redis.from_url(REDIS_URL)
+
+@app.before_serving
+async def start_timestamp_task():
+    """Start the background task that keeps current_timestamp fresh"""
+    global timestamp_task
+    timestamp_task = asyncio.create_task(refresh_timestamp())
+
+@app.before_serving
+async def start_write_worker():
+    """Set up the limit on queued writes in flight to Appwrite"""
+    global write_slots
+    write_slots = asyncio.Semaphore(WRITE_CONCURRENCY)
+
+@app.after_serving
+async def stop_write_worker():
+    """Flush queued writes before shutdown (runs before the HTTP session is closed)"""
+    if not document_write_tasks:
+        return
+    _, pending = await asyncio.wait(list(document_write_tasks.values()), timeout=10)
+    if pending:
+        logger.error("❌ Shutting down with %s queued writes not sent", pending_write_count)
+        for task in pending:
+            task.cancel()
+
+@app.after_serving
+async def stop_timestamp_task():
+    """Stop refreshing current_timestamp"""
+    if timestamp_task is not None:
+        timestamp_task.cancel()
+
+@app.after_serving
+async def close_http_session():
+    """Close the shared Appwrite HTTP session"""
+    if http_session is not None:
+        await http_session.close()
+
+@app.after_serving
+async def close_redis_client():
+    """Close the Redis connection pool"""
+    if redis_client is not None:
+        await redis_client.aclose()
+
+# Status page body is static apart from the timestamp, so serialize it once and splice the timestamp in
+STATUS_BODY_PREFIX = orjson.dumps({
+    'status': 'Water Kiosk Hardware Server Active',
+    'message': 'Python Quart application for kiosk hardware integration',
+    'features': ['dispense_verification', 'dispense_verification_batch', 'database_query', 'database_create', 'database_update'],
+    'endpoints': {
+        'status': 'GET / - This status page',
+        'dispense_verification': 'POST /dispense-verification - Verify user for water dispensing',
+        'dispense_verification_batch': 'POST /dispense-verification/batch - Verify many users in one call',
+        'database_query': 'POST /database/query - Query database documents',
+        'database_create': 'POST /database/create - Create database documents',
+        'database_update': 'POST /database/update - Update database documents',
+        'test_database': 'POST /test-database - Test database connection'
+    }
+})[:-1] + b',"timestamp":"'
+
+@app.before_request
+async def reject_oversized_or_non_json_body():
+    """Fail fast on bodies we would never accept, before reading or parsing them"""
+    if request.content_length and request.content_length > MAX_REQUEST_BODY_BYTES:
+        return jsonify({'error': f'Request body too large (max {MAX_REQUEST_BODY_BYTES} bytes)'}), 413
+    has_body = request.content_length or 'Transfer-Encoding' in request.headers
+    if request.method == 'POST' and has_body and not request.is_json:
+        return jsonify({'error': 'Content-Type must be application/json'}), 415
+
+@app.errorhandler(RequestEntityTooLarge)
+async def request_entity_too_large(error):
+    """Bodies over MAX_CONTENT_LENGTH that had no (or a lying) Content-Length header"""
+    return jsonify({'error': f'Request body too large (max {MAX_REQUEST_BODY_BYTES} bytes)'}), 413
 
 @app.route('/', methods=['GET'])
-def status():
+async def status():
     """Status endpoint"""
-    return jsonify({
-        'status': 'Water Kiosk Hardware Server Active',
-        'message': 'Python Flask application for kiosk hardware integration',
-        'timestamp': datetime.now().isoformat(),
-        'features': ['dispense_verification', 'database_query', 'database_create', 'database_update'],
-        'endpoints': {
-            'status': 'GET / - This status page',
-            'dispense_verification': 'POST /dispense-verification - Verify user for water dispensing',
-            'database_query': 'POST /database/query - Query database documents',
-            'database_create': 'POST /database/create - Create database documents',
-            'database_update': 'POST /database/update - Update database documents',
-            'test_database': 'POST /test-database - Test database connection'
-        }
-    })
+    body = STATUS_BODY_PREFIX + current_timestamp.encode('ascii') + b'"}'
+    return Response(body, mimetype='application/json')
 
 @app.route('/dispense-verification', methods=['POST'])
-def dispense_verification():
+async def dispense_verification():
     """Main endpoint for kiosk hardware - verify user credentials for water dispensing"""
     try:
-        data = request.get_json()
+        data = await request.get_json(silent=True)
         
-        if not data:
+        if not data or not isinstance(data, dict):
             return jsonify({'error': 'No JSON data provided'}), 400
         
-        logger.info(f"🔍 Processing dispense verification: {data}")
+        logger.info("🔍 Processing dispense verification: %s", data)
         
         # Extract required fields (UPDATED: user_id is now phone_number)
         kiosk_id = data.get('kiosk_id')
@@ -75,87 +330,117 @@ def dispense_verification():
                 'reason': 'Invalid request format'
             }), 400
         
-        approved = False
-        reason = ''
-        user_data = None
+        # Reject malformed phone numbers before touching the database
+        if not get_phone_variants(str(phone_number)):
+            return jsonify({
+                'error': 'Invalid phone number format',
+                'approved': False,
+                'reason': 'Invalid request format'
+            }), 400
         
         try:
             # First, try to verify user in the database (UPDATED FOR UNIFIED SCHEMA)
             logger.info('📡 Checking user credentials in database...')
-            user_lookup = lookup_customer_by_phone(phone_number, pin)
-            
-            if user_lookup['found']:
-                if not user_lookup['is_registered']:
-                    approved = False
-                    reason = 'Customer not fully registered'
-                    logger.info(f"❌ Customer {phone_number} not fully registered")
-                elif not user_lookup['active']:
-                    approved = False
-                    reason = 'Subscription inactive'
-                    logger.info(f"❌ Customer {phone_number} subscription inactive")
-                elif not user_lookup['valid_pin']:
-                    approved = False
-                    reason = 'Invalid PIN'
-                    logger.info(f"❌ Invalid PIN for customer {phone_number}")
-                else:
-                    approved = True
-                    reason = 'Customer verified in database'
-                    user_data = user_lookup['customer_data']
-                    logger.info(f"✅ Customer {phone_number} verified successfully")
-            else:
-                approved = False
-                reason = 'Customer not found in database'
-                logger.info(f"❌ Customer {phone_number} not found in database")
+            user_lookup = await lookup_customer_by_phone(phone_number, pin)
+            approved, reason, user_data = evaluate_customer_lookup(phone_number, user_lookup)
                 
         except Exception as error:
-            logger.error(f"❌ Database lookup failed: {str(error)}")
-            logger.info('🔄 Falling back to random approval logic...')
-            
-            # Fall back to original 90% approval rate if database is unavailable
-            approved = random.random() < 0.9
-            reason = ('Database unavailable - approved by fallback (90% chance)' if approved 
-                     else 'Database unavailable - denied by fallback (10% chance)')
+            logger.error("❌ Database lookup failed: %s", error)
+            approved, reason = database_fallback_verdict(error)
+            user_data = None
         
-        # Prepare response (same format as Node.js version, but user_id = phone_number)
-        response = {
-            'type': 'dispense_response',
-            'user_id': phone_number,  # Kiosk expects user_id field
-            'pin': pin,
-            'volume_ml': volume_ml,
-            'approved': approved,
-            'reason': reason,
-            'timestamp': datetime.now().isoformat(),
-            'kiosk_id': kiosk_id
-        }
+        response = build_dispense_response(kiosk_id, phone_number, pin, volume_ml, approved, reason, user_data)
+        
+        logger.info("📤 Sent response: %s - %s", '✅ APPROVED' if approved else '❌ DENIED', reason)
+        
+        return Response(msgspec.json.encode(response), mimetype='application/json')
         
-        # Add user data if available
-        if user_data:
-            response['user_data'] = user_data
+    except HTTPException:
+        # e.g. RequestEntityTooLarge from a body without Content-Length - let Quart answer
+        raise
+    except Exception as e:
+        logger.error('Dispense verification error: %s', e)
+        return jsonify({
+            'error': str(e),
+            'type': 'server_error',
+            'approved': False,
+            'reason': 'Server error occurred',
+            'timestamp': current_timestamp
+        }), 500
+
+@app.route('/dispense-verification/batch', methods=['POST'])
+async def dispense_verification_batch():
+    """Verify many kiosk requests at once with one customers query per 100 phone variants - results keep request order"""
+    try:
+        data = await request.get_json(silent=True)
+        verifications = data.get('verifications') if isinstance(data, dict) else data
         
-        # Add user data if available
-        if user_data:
-            response['user_data'] = user_data
+        if not isinstance(verifications, list) or not verifications:
+            return jsonify({'error': 'Expected a non-empty list of verifications'}), 400
         
-        logger.info(f"📤 Sent response: {'✅ APPROVED' if approved else '❌ DENIED'} - {reason}")
+        if len(verifications) > MAX_BATCH_VERIFICATIONS:
+            return jsonify({'error': f'At most {MAX_BATCH_VERIFICATIONS} verifications per batch'}), 400
         
-        return jsonify(response)
+        logger.info("🔍 Processing batch dispense verification: %s requests", len(verifications))
         
+        results = [None] * len(verifications)
+        valid_indexes = []
+        
+        for index, item in enumerate(verifications):
+            item = item if isinstance(item, dict) else {}
+            kiosk_id = item.get('kiosk_id')
+            phone_number = item.get('user_id')
+            pin = item.get('pin')
+            
+            if not all([kiosk_id, phone_number, pin]) or not get_phone_variants(str(phone_number)):
+                results[index] = build_dispense_response(kiosk_id, phone_number, pin, item.get('volume_ml'),
+                                                         False, 'Invalid request format', None)
+            else:
+                valid_indexes.append(index)
+        
+        if valid_indexes:
+            credentials = [(verifications[index]['user_id'], verifications[index]['pin']) for index in valid_indexes]
+            
+            try:
+                user_lookups = await lookup_customers_by_phone(credentials)
+                verdicts = [evaluate_customer_lookup(phone_number, user_lookup)
+                            for (phone_number, _), user_lookup in zip(credentials, user_lookups)]
+            except Exception as error:
+                logger.error("❌ Batch database lookup failed: %s", error)
+                verdicts = [(*database_fallback_verdict(error), None) for _ in valid_indexes]
+            
+            for index, (approved, reason, user_data) in zip(valid_indexes, verdicts):
+                item = verifications[index]
+                results[index] = build_dispense_response(item['kiosk_id'], item['user_id'], item['pin'],
+                                                         item.get('volume_ml'), approved, reason, user_data)
+        
+        approved_count = sum(1 for result in results if result.approved)
+        logger.info("📤 Sent batch response: %s/%s approved", approved_count, len(results))
+        
+        return Response(msgspec.json.encode({
+            'type': 'batch_dispense_response',
+            'results': results,
+            'timestamp': current_timestamp
+        }), mimetype='application/json')
+        
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f'Dispense verification error: {str(e)}')
+        logger.error('Batch dispense verification error: %s', e)
         return jsonify({
             'error': str(e),
             'type': 'server_error',
             'approved': False,
             'reason': 'Server error occurred',
-            'timestamp': datetime.now().isoformat()
+            'timestamp': current_timestamp
         }), 500
 
 @app.route('/database/query', methods=['POST'])
-def database_query():
+async def database_query():
     """Handle database query requests"""
     try:
-        data = request.get_json()
-        logger.info(f'🔍 Processing database query: {data}')
+        data = await request.get_json(silent=True) or {}
+        logger.info('🔍 Processing database query: %s', data)
         
         database = data.get('database', APPWRITE_DATABASE_ID)
         collection = data.get('collection')
@@ -168,7 +453,7 @@ def database_query():
                 'request_id': request_id,
                 'success': False,
                 'error': 'Collection ID is required',
-                'timestamp': datetime.now().isoformat()
+                'timestamp': current_timestamp
             }), 400
         
         # Build query path
@@ -177,7 +462,7 @@ def database_query():
             query_params = '&'.join([f'queries[]={urllib.parse.quote(q)}' for q in queries])
             path += f'?{query_params}'
         
-        result = make_appwrite_request('GET', path)
+        result = await make_appwrite_request('GET', path)
         
         response = {
             'type': 'query_response',
@@ -185,29 +470,31 @@ def database_query():
             'success': True,
             'data': result['data'],
             'total': result['data'].get('total', 0),
-            'timestamp': datetime.now().isoformat()
+            'timestamp': current_timestamp
         }
         
-        logger.info(f"✅ Database query successful: {result['data'].get('total', 0)} documents")
+        logger.info("✅ Database query successful: %s documents", result['data'].get('total', 0))
         return jsonify(response)
         
+    except HTTPException:
+        raise
     except Exception as error:
-        logger.error(f"❌ Database query failed: {str(error)}")
+        logger.error("❌ Database query failed: %s", error)
         response = {
             'type': 'query_response',
             'request_id': data.get('request_id') if 'data' in locals() else None,
             'success': False,
             'error': str(error),
-            'timestamp': datetime.now().isoformat()
+            'timestamp': current_timestamp
         }
         return jsonify(response), 500
 
 @app.route('/database/create', methods=['POST'])
-def database_create():
+async def database_create():
     """Handle database document creation"""
     try:
-        data = request.get_json()
-        logger.info(f'🔍 Processing database create: {data}')
+        data = await request.get_json(silent=True) or {}
+        logger.info('🔍 Processing database create: %s', data)
         
         database = data.get('database', APPWRITE_DATABASE_ID)
         collection = data.get('collection')
@@ -221,7 +508,7 @@ def database_create():
                 'request_id': request_id,
                 'success': False,
                 'error': 'Collection ID and document_data are required',
-                'timestamp': datetime.now().isoformat()
+                'timestamp': current_timestamp
             }), 400
         
         path = f'/v1/databases/{database}/collections/{collection}/documents'
@@ -230,36 +517,62 @@ def database_create():
             'data': document_data
         }
         
-        result = make_appwrite_request('POST', path, body)
+        sync_write = is_sync_write()
+        if not sync_write and document_id == 'unique()':
+            # Queued creates get a concrete ID so a retry after a late/lost response hits 409 instead of duplicating
+            body = {**body, 'documentId': uuid.uuid4().hex}
+        
+        write_mode = enqueue_write('POST', path, body, collection, body['documentId'], request_id, sync_write)
+        if write_mode == 'queued':
+            logger.info("📥 Document create queued: %s", request_id)
+            return jsonify({
+                'type': 'create_response',
+                'request_id': request_id,
+                'accepted': True,
+                'document_id': body['documentId'],
+                'timestamp': current_timestamp
+            }), 202
+        if write_mode == 'busy':
+            return jsonify({
+                'type': 'create_response',
+                'request_id': request_id,
+                'success': False,
+                'error': 'Earlier writes to this document are still pending - retry later',
+                'timestamp': current_timestamp
+            }), 503
+        
+        result = await make_appwrite_request('POST', path, body)
         
         response = {
             'type': 'create_response',
             'request_id': request_id,
             'success': True,
             'data': result['data'],
-            'timestamp': datetime.now().isoformat()
+            'timestamp': current_timestamp
         }
         
-        logger.info(f"✅ Document created successfully: {result['data']['$id']}")
+        logger.info("✅ Document created successfully: %s", result['data']['$id'])
         return jsonify(response)
         
+    except HTTPException:
+        raise
     except Exception as error:
-        logger.error(f"❌ Document creation failed: {str(error)}")
+        logger.error("❌ Document creation failed: %s", error)
         response = {
             'type': 'create_response',
             'request_id': data.get('request_id') if 'data' in locals() else None,
             'success': False,
             'error': str(error),
-            'timestamp': datetime.now().isoformat()
+            'timestamp': current_timestamp
         }
         return jsonify(response), 500
 
 @app.route('/database/update', methods=['POST'])
-def database_update():
+async def database_update():
     """Handle database document updates"""
     try:
-        data = request.get_json()
-        logger.info(f'🔍 Processing database update: {data}')
+        data = await request.get_json(silent=True) or {}
+        logger.info('🔍 Processing database update: %s', data)
         
         database = data.get('database', APPWRITE_DATABASE_ID)
         collection = data.get('collection')
@@ -273,54 +586,69 @@ def database_update():
                 'request_id': request_id,
                 'success': False,
                 'error': 'Collection ID, document_id, and document_data are required',
-                'timestamp': datetime.now().isoformat()
+                'timestamp': current_timestamp
             }), 400
         
         path = f'/v1/databases/{database}/collections/{collection}/documents/{document_id}'
         body = {'data': document_data}
         
-        result = make_appwrite_request('PATCH', path, body)
+        write_mode = enqueue_write('PATCH', path, body, collection, document_id, request_id, is_sync_write())
+        if write_mode == 'queued':
+            logger.info("📥 Document update queued: %s", document_id)
+            return jsonify({
+                'type': 'update_response',
+                'request_id': request_id,
+                'accepted': True,
+                'timestamp': current_timestamp
+            }), 202
+        if write_mode == 'busy':
+            return jsonify({
+                'type': 'update_response',
+                'request_id': request_id,
+                'success': False,
+                'error': 'Earlier writes to this document are still pending - retry later',
+                'timestamp': current_timestamp
+            }), 503
+        
+        result = await make_appwrite_request('PATCH', path, body)
         
         response = {
             'type': 'update_response',
             'request_id': request_id,
             'success': True,
             'data': result['data'],
-            'timestamp': datetime.now().isoformat()
+            'timestamp': current_timestamp
         }
         
-        logger.info(f"✅ Document updated successfully: {document_id}")
+        if collection == CUSTOMERS_COLLECTION_ID:
+            await invalidate_customer_cache(document_id)
+        
+        logger.info("✅ Document updated successfully: %s", document_id)
         return jsonify(response)
         
+    except HTTPException:
+        raise
     except Exception as error:
-        logger.error(f"❌ Document update failed: {str(error)}")
+        logger.error("❌ Document update failed: %s", error)
         response = {
             'type': 'update_response',
             'request_id': data.get('request_id') if 'data' in locals() else None,
             'success': False,
             'error': str(error),
-            'timestamp': datetime.now().isoformat()
+            'timestamp': current_timestamp
         }
         return jsonify(response), 500
 
 @app.route('/test-database', methods=['POST'])
-def test_database():
+async def test_database():
     """Test database connection"""
     try:
         # Test listing collections
-        url = f'{APPWRITE_ENDPOINT}/databases/{APPWRITE_DATABASE_ID}/collections'
-        
-        headers = {
-            'X-Appwrite-Project': APPWRITE_PROJECT_ID,
-            'X-Appwrite-Key': APPWRITE_API_KEY,
-            'Content-Type': 'application/json'
-        }
+        async with http_session.get(COLLECTIONS_URL, timeout=APPWRITE_TIMEOUT) as response:
+            response.raise_for_status()
+            data = orjson.loads(await response.read())
         
-        request_obj = urllib.request.Request(url, headers=headers)
-        response = urllib.request.urlopen(request_obj, timeout=10)
-        data = json.loads(response.read().decode('utf-8'))
-        
-        logger.info(f"✅ Database connected! Found {data['total']} collections")
+        logger.info("✅ Database connected! Found %s collections", data['total'])
         
         collection_names = [col['name'] for col in data.get('collections', [])]
         
@@ -329,106 +657,370 @@ def test_database():
             'message': 'Database connection working via HTTP!',
             'collections_found': data['total'],
             'collection_names': collection_names,
-            'timestamp': datetime.now().isoformat()
+            'timestamp': current_timestamp
         })
         
     except Exception as e:
-        logger.error(f"❌ Database test failed: {str(e)}")
+        logger.error("❌ Database test failed: %s", e)
         return jsonify({
             'status': 'DATABASE_ERROR',
             'error': str(e),
-            'timestamp': datetime.now().isoformat()
+            'timestamp': current_timestamp
         }), 500
 
-def lookup_customer_by_phone(phone_number, pin):
-    """Look up customer in unified customers collection - updated for SMS/Kiosk integration"""
+def get_phone_variants(phone_number):
+    """Unique phone number formats to search for, in priority order (empty tuple if malformed)"""
+    phone_number = phone_number.strip()
+    if not PHONE_NUMBER_RE.match(phone_number):
+        return ()
+    return build_phone_variants(phone_number)
+
+@functools.lru_cache(maxsize=4096)
+def build_phone_variants(phone_number):
+    """Memoized variant builder - only ever called with validated (at most 16 character) numbers"""
+    local_number = PHONE_PREFIX_RE.sub('', phone_number, count=1)
+    return tuple(dict.fromkeys([
+        phone_number,
+        f'0{local_number}',
+        f'254{local_number}',
+        local_number,
+        f'+254{local_number}'
+    ]))
+
+@customer_lookup_breaker
+async def query_customers_by_phone(phone_variants, pin=None):
+    """Fetch customer documents matching any of the phone number variants (and the PIN, if given) in a single query"""
+    values = ','.join(orjson.dumps(variant).decode('utf-8') for variant in phone_variants)
+    queries = [f'equal("phone_number",[{values}])']
+    if pin is not None:
+        # Served by the idx_phone_pin (phone_number, pin) index in Appwrite
+        queries.append(f'equal("pin",[{orjson.dumps(str(pin)).decode("utf-8")}])')
+    queries.append(f'limit({len(phone_variants)})')
+    url = f'{CUSTOMERS_DOCUMENTS_URL}?' + '&'.join(f'queries[]={urllib.parse.quote(query)}' for query in queries)
+    
+    async with http_session.get(url, timeout=LOOKUP_TIMEOUT) as response:
+        # Not raise_for_status(): its ClientResponseError repeats the URL - and with it the PIN - in logs.
+        # Appwrite's error message can echo the query too, so only the HTTP reason is kept.
+        if not 200 <= response.status < 300:
+            raise AppwriteError(response.status, response.reason or 'Customer query failed')
+        data = orjson.loads(await response.read())
+    
+    return data.get('documents') or []
+
+async def refresh_timestamp():
+    """Update current_timestamp so handlers can read it without calling datetime.now()"""
+    global current_timestamp
+    while True:
+        current_timestamp = datetime.now().isoformat()
+        await asyncio.sleep(TIMESTAMP_REFRESH_INTERVAL)
+
+def is_sync_write():
+    """Whether the caller asked to wait for Appwrite to confirm the write (?sync=true)"""
+    return request.args.get('sync', '').lower() in ('1', 'true', 'yes')
+
+def enqueue_write(method, path, body, collection, document_id, request_id, sync=False):
+    """Queue an Appwrite write for the background sender.
+
+    Returns 'queued', 'sync' (caller should write to Appwrite itself) or 'busy' (the write can't be
+    queued, but earlier queued writes to the same document are still pending, so writing it now
+    would apply it out of order).
+    """
+    global pending_write_count
+    key = (collection, document_id)
+    
+    # While Appwrite is failing, let the caller see the error (and retry) instead of accepting the write
+    if sync or appwrite_breaker.is_open or pending_write_count >= WRITE_QUEUE_SIZE:
+        if key in document_writes:
+            logger.warning("⚠️ Earlier queued writes to %s are pending - rejecting %s", document_id, request_id)
+            return 'busy'
+        if not sync:
+            logger.warning("⚠️ Write queue unavailable (breaker open or queue full) - writing %s synchronously", request_id)
+        return 'sync'
+    
+    document_writes.setdefault(key, collections.deque()).append({
+        'method': method,
+        'path': path,
+        'body': body,
+        'collection': collection,
+        'document_id': document_id,
+        'request_id': request_id,
+        'retries': 0
+    })
+    pending_write_count += 1
+    if key not in document_write_tasks:
+        document_write_tasks[key] = asyncio.create_task(send_document_writes(key))
+    return 'queued'
+
+async def send_document_writes(key):
+    """Send one document's queued writes to Appwrite in order, each finishing (or giving up) before the next"""
+    global pending_write_count
+    writes = document_writes[key]
     try:
-        logger.info(f"🔍 Looking up customer {phone_number} in customers database...")
-        
-        # Try multiple phone number formats (same logic as SMS server)
-        phone_variants = [
-            phone_number,
-            phone_number.replace('+254', '0'),
-            phone_number.replace('+254', '254'),
-            phone_number.replace('+254', ''),
-            f"+254{phone_number.lstrip('0')}" if not phone_number.startswith('+') else phone_number
-        ]
-        
-        for variant in phone_variants:
-            query = f'equal("phone_number","{variant}")'
-            url = f'{APPWRITE_ENDPOINT}/databases/{APPWRITE_DATABASE_ID}/collections/{CUSTOMERS_COLLECTION_ID}/documents?queries[]={urllib.parse.quote(query)}'
-            
-            headers = {
-                'X-Appwrite-Project': APPWRITE_PROJECT_ID,
-                'X-Appwrite-Key': APPWRITE_API_KEY,
-                'Content-Type': 'application/json'
-            }
+        while writes:
+            await apply_queued_write(writes[0])
+            writes.popleft()
+            pending_write_count -= 1
+    finally:
+        pending_write_count -= len(writes)
+        del document_writes[key]
+        del document_write_tasks[key]
+
+async def apply_queued_write(write):
+    """Send one queued write to Appwrite - transient failures are retried (holding back the document's
+    later writes), 4xx rejections are logged and dropped"""
+    while True:
+        try:
+            async with write_slots:
+                result = await make_appwrite_request(write['method'], write['path'], write['body'])
+        except Exception as error:
+            status = getattr(error, 'status', None)
+            if status == 409 and write['method'] == 'POST' and write['retries'] > 0:
+                # An earlier attempt was stored even though its response never arrived
+                logger.info("✅ Queued write applied: %s %s (request %s, already stored by an earlier attempt)",
+                            write['method'], write['body'].get('documentId'), write['request_id'])
+                return
+            if not (status and 400 <= status < 500) and write['retries'] < WRITE_MAX_RETRIES:
+                write['retries'] += 1
+                delay = WRITE_RETRY_DELAY * 2 ** (write['retries'] - 1)
+                logger.warning("⚠️ Queued write failed: %s %s (request %s): %s - retry %s/%s in %ss",
+                               write['method'], write['path'], write['request_id'], error,
+                               write['retries'], WRITE_MAX_RETRIES, delay)
+                await asyncio.sleep(delay)
+                continue
+            logger.error("❌ Queued write dropped: %s %s (request %s): %s", write['method'], write['path'], write['request_id'], error)
+            return
+        
+        if write['method'] == 'PATCH' and write['collection'] == CUSTOMERS_COLLECTION_ID:
+            await invalidate_customer_cache(write['document_id'])
+        
+        logger.info("✅ Queued write applied: %s %s (request %s)", write['method'], result['data'].get('$id'), write['request_id'])
+        return
+
+def appwrite_bool(value):
+    """Interpret an Appwrite boolean attribute that may be stored as a bool or a string"""
+    if isinstance(value, str):
+        return value.strip().lower() == 'true'
+    return value is True
+
+def is_approved_lookup(lookup):
+    """Only approvals are cached - a denied customer (e.g. inactive until they pay via SMS) must be re-checked every time"""
+    return lookup['found'] and lookup['is_registered'] and lookup['active'] and lookup['valid_pin']
+
+def customer_cache_key(phone_number, pin):
+    """Cache key for a phone number + PIN lookup (hashed so PINs are never stored in clear)"""
+    return hashlib.sha256(f"{phone_number}|{pin}".encode('utf-8')).hexdigest()
+
+async def get_cached_customer_lookup(cache_key):
+    """Return a cached lookup result from memory or Redis, or None on a miss"""
+    lookup = customer_cache.get(cache_key)
+    if lookup is not None:
+        return lookup
+    
+    if redis_client is None:
+        return None
+    
+    try:
+        cached = await redis_client.get(CUSTOMER_CACHE_PREFIX + cache_key)
+    except Exception as e:
+        logger.warning("⚠️ Redis cache read failed: %s", e)
+        return None
+    
+    if cached is None:
+        return None
+    
+    lookup = orjson.loads(cached)
+    customer_cache[cache_key] = lookup
+    return lookup
+
+async def cache_customer_lookup(cache_key, lookup):
+    """Store a lookup result in memory and Redis, indexed by document ID for invalidation"""
+    customer_cache[cache_key] = lookup
+    
+    if redis_client is None:
+        return
+    
+    try:
+        index_key = f"{CUSTOMER_CACHE_PREFIX}doc:{lookup['document_id']}"
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.setex(CUSTOMER_CACHE_PREFIX + cache_key, CUSTOMER_CACHE_TTL, orjson.dumps(lookup))
+            pipe.sadd(index_key, cache_key)
+            pipe.expire(index_key, CUSTOMER_CACHE_TTL)
+            await pipe.execute()
+    except Exception as e:
+        logger.warning("⚠️ Redis cache write failed: %s", e)
+
+async def invalidate_customer_cache(document_id):
+    """Drop cached lookups for a customer document after it has been updated"""
+    # The in-process layer is tiny and short-lived, so just clear it - this only reaches the current
+    # worker; other workers keep their entries until LOCAL_CACHE_TTL expires
+    customer_cache.clear()
+    
+    if redis_client is None:
+        return
+    
+    try:
+        index_key = f"{CUSTOMER_CACHE_PREFIX}doc:{document_id}"
+        cache_keys = await redis_client.smembers(index_key)
+        keys = [CUSTOMER_CACHE_PREFIX + key.decode('utf-8') for key in cache_keys]
+        await redis_client.delete(index_key, *keys)
+    except Exception as e:
+        logger.warning("⚠️ Redis cache invalidation failed: %s", e)
+
+def index_customers_by_phone(documents):
+    """Map phone_number -> customer document (first document wins)"""
+    customers_by_phone = {}
+    for document in documents:
+        customers_by_phone.setdefault(document.get('phone_number'), document)
+    return customers_by_phone
+
+def match_customer(phone_number, pin, customers_by_phone):
+    """Build a lookup result for phone_number + pin from already fetched customer documents"""
+    # Keep the first variant (in priority order) that matches
+    for variant in get_phone_variants(str(phone_number)):
+        customer = customers_by_phone.get(variant)
+        if customer:
+            # Constant-time PIN check; booleans may come back from Appwrite as true or "true"
+            pin_match = hmac.compare_digest(str(customer.get('pin') or '').encode('utf-8'), str(pin).encode('utf-8'))
+            is_registered = appwrite_bool(customer.get('is_registered'))
+            active = appwrite_bool(customer.get('active'))
             
-            request_obj = urllib.request.Request(url, headers=headers)
-            response = urllib.request.urlopen(request_obj, timeout=5)
-            data = json.loads(response.read().decode('utf-8'))
+            logger.info("👤 Found customer: %s, registered: %s, active: %s, PIN match: %s", variant, is_registered, active, pin_match)
             
-            if data.get('documents') and len(data['documents']) > 0:
-                customer = data['documents'][0]
-                pin_match = customer.get('pin') == pin
-                is_registered = customer.get('is_registered') == True
-                active = customer.get('active') == True
-                
-                logger.info(f"👤 Found customer: {variant}, registered: {is_registered}, active: {active}, PIN match: {pin_match}")
-                
-                return {
-                    'found': True,
-                    'valid_pin': pin_match,
-                    'is_registered': is_registered,
-                    'active': active,
-                    'customer_data': {
-                        'phone_number': customer.get('phone_number'),
-                        'account_id': customer.get('account_id'),
-                        'full_name': customer.get('full_name'),
-                        'active': customer.get('active'),
-                        'credits': customer.get('credits', 0)
-                    }
+            return {
+                'found': True,
+                'valid_pin': pin_match,
+                'is_registered': is_registered,
+                'active': active,
+                'document_id': customer.get('$id'),
+                'customer_data': {
+                    'phone_number': customer.get('phone_number'),
+                    'account_id': customer.get('account_id'),
+                    'full_name': customer.get('full_name'),
+                    'active': customer.get('active'),
+                    'credits': customer.get('credits', 0)
                 }
+            }
+    
+    logger.info("❌ Customer %s not found in database", phone_number)
+    return {
+        'found': False,
+        'valid_pin': False,
+        'is_registered': False,
+        'active': False
+    }
+
+async def lookup_customer_by_phone(phone_number, pin):
+    """Look up customer in unified customers collection - updated for SMS/Kiosk integration"""
+    try:
+        cache_key = customer_cache_key(phone_number, pin)
+        cached = await get_cached_customer_lookup(cache_key)
+        if cached is not None:
+            logger.info("⚡ Customer %s served from cache", phone_number)
+            return cached
         
-        logger.info(f"❌ Customer {phone_number} not found in database")
-        return {
-            'found': False,
-            'valid_pin': False,
-            'is_registered': False,
-            'active': False
-        }
+        logger.info("🔍 Looking up customer %s in customers database...", phone_number)
+        
+        # One IN-list query for all phone number formats (same formats as SMS server) plus the PIN;
+        # only when nothing matches, query again without the PIN to tell "wrong PIN" from "not found"
+        phone_variants = get_phone_variants(str(phone_number))
+        documents = await query_customers_by_phone(phone_variants, pin)
+        if not documents:
+            documents = await query_customers_by_phone(phone_variants)
+        lookup = match_customer(phone_number, pin, index_customers_by_phone(documents))
+        
+        if is_approved_lookup(lookup):
+            await cache_customer_lookup(cache_key, lookup)
+        return lookup
             
     except Exception as e:
-        logger.error(f"❌ Database connection error: {str(e)}")
+        logger.error("❌ Database connection error: %s", e)
         raise e
 
-def make_appwrite_request(method, path, body=None):
-    """Generic Appwrite API request function - converted from Node.js"""
+async def lookup_customers_by_phone(credentials):
+    """Look up many (phone_number, pin) pairs - cache first, then one IN-list query per 100 phone variants"""
     try:
-        body_string = json.dumps(body).encode('utf-8') if body else None
+        cache_keys = [customer_cache_key(phone_number, pin) for phone_number, pin in credentials]
+        lookups = await asyncio.gather(*[get_cached_customer_lookup(cache_key) for cache_key in cache_keys])
+        misses = [index for index, lookup in enumerate(lookups) if lookup is None]
         
-        headers = {
-            'X-Appwrite-Project': APPWRITE_PROJECT_ID,
-            'X-Appwrite-Key': APPWRITE_API_KEY,
-            'Content-Type': 'application/json'
-        }
+        if not misses:
+            return lookups
         
-        if body_string:
-            headers['Content-Length'] = str(len(body_string))
+        logger.info("🔍 Looking up %s customers in customers database...", len(misses))
         
-        url = f'{APPWRITE_ENDPOINT}{path}'
-        request_obj = urllib.request.Request(url, data=body_string, headers=headers, method=method)
-        response = urllib.request.urlopen(request_obj, timeout=10)
+        phone_variants = list(dict.fromkeys(
+            variant for index in misses for variant in get_phone_variants(str(credentials[index][0]))
+        ))
+        chunks = [phone_variants[start:start + APPWRITE_MAX_QUERY_VALUES]
+                  for start in range(0, len(phone_variants), APPWRITE_MAX_QUERY_VALUES)]
+        results = await asyncio.gather(*[query_customers_by_phone(chunk) for chunk in chunks])
+        customers_by_phone = index_customers_by_phone(document for documents in results for document in documents)
         
-        response_data = json.loads(response.read().decode('utf-8'))
+        for index in misses:
+            phone_number, pin = credentials[index]
+            lookups[index] = match_customer(phone_number, pin, customers_by_phone)
+            if is_approved_lookup(lookups[index]):
+                await cache_customer_lookup(cache_keys[index], lookups[index])
+        
+        return lookups
+            
+    except Exception as e:
+        logger.error("❌ Database connection error: %s", e)
+        raise e
+
+def evaluate_customer_lookup(phone_number, user_lookup):
+    """Decide whether to dispense for a customer lookup - returns (approved, reason, user_data)"""
+    if not user_lookup['found']:
+        logger.info("❌ Customer %s not found in database", phone_number)
+        return False, 'Customer not found in database', None
+    if not user_lookup['is_registered']:
+        logger.info("❌ Customer %s not fully registered", phone_number)
+        return False, 'Customer not fully registered', None
+    if not user_lookup['active']:
+        logger.info("❌ Customer %s subscription inactive", phone_number)
+        return False, 'Subscription inactive', None
+    if not user_lookup['valid_pin']:
+        logger.info("❌ Invalid PIN for customer %s", phone_number)
+        return False, 'Invalid PIN', None
+    
+    logger.info("✅ Customer %s verified successfully", phone_number)
+    return True, 'Customer verified in database', user_lookup['customer_data']
+
+def database_fallback_verdict(error):
+    """Deny dispensing when the database can't be checked - returns (approved, reason)"""
+    if isinstance(error, CircuitOpenError):
+        return False, 'Service degraded'
+    return False, 'Database unavailable'
+
+def build_dispense_response(kiosk_id, phone_number, pin, volume_ml, approved, reason, user_data):
+    """Prepare a DispenseResponse - user_data is only included when available"""
+    return DispenseResponse(
+        user_id=phone_number,
+        pin=pin,
+        volume_ml=volume_ml,
+        approved=approved,
+        reason=reason,
+        timestamp=current_timestamp,
+        kiosk_id=kiosk_id,
+        user_data=user_data or None
+    )
+
+@appwrite_breaker
+async def make_appwrite_request(method, path, body=None):
+    """Generic Appwrite API request function - converted from Node.js"""
+    try:
+        body_bytes = orjson.dumps(body) if body else None
+        async with http_session.request(method, APPWRITE_ENDPOINT + path, data=body_bytes,
+                                        timeout=APPWRITE_TIMEOUT) as response:
+            response_data = orjson.loads(await response.read())
         
         if 200 <= response.status < 300:
             return {'status': response.status, 'data': response_data}
         else:
-            raise Exception(f"HTTP {response.status}: {response_data.get('message', 'Unknown error')}")
+            raise AppwriteError(response.status, response_data.get('message', 'Unknown error'))
             
     except Exception as e:
-        logger.error(f"Appwrite request failed: {str(e)}")
+        logger.error("Appwrite request failed: %s", e)
         raise e
 
 if __name__ == '__main__':
@@ -440,6 +1032,7 @@ if __name__ == '__main__':
     print("📡 Endpoints:")
     print("  - GET  /                     - Status page")
     print("  - POST /dispense-verification - Main kiosk endpoint (phone + PIN verification)")
+    print("  - POST /dispense-verification/batch - Batch verification (up to 100 per call)")
     print("  - POST /database/query       - Database queries")
     print("  - POST /database/create      - Create database documents")
     print("  - POST /database/update      - Update database documents")
@@ -447,8 +1040,16 @@ if __name__ == '__main__':
     print("")
     print("🔧 UNIFIED SCHEMA: Uses same customers collection as SMS server")
     print("🔧 VERIFICATION: phone_number + pin + active subscription status")
-    print("🔧 For 600+ kiosks: Use load balancer with multiple instances of this server")
+    print("🔧 For 600+ kiosks: Run with gunicorn -c gunicorn.conf.py water_kiosk_hardware_server:app")
     print("")
     
-    # Start the server
-    app.run(host='0.0.0.0', port=8080, debug=True)
+    # Use libuv's event loop when available (gunicorn's uvicorn workers pick it up automatically)
+    try:
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    except ImportError:
+        logger.warning("⚠️ uvloop not installed - using the default asyncio event loop")
+    
+    # Start the development server (local testing only - not for kiosk traffic)
+    logger.warning("⚠️ Running the development server - use gunicorn.conf.py for production")
+    app.run(host='0.0.0.0', port=8080)